@@ -5,6 +5,8 @@ import requests
 import base64
 from PIL import Image
 import io
+import os
+from shared_backend import RateLimited, backend_from_url, make_key
 # ==========================================
 # 1. 설정 및 API 연결 (st.set_page_config는 반드시 첫 번째!)
 # ==========================================
@@ -23,6 +25,33 @@ except Exception as e:
 # 클라이언트 설정
 client = OpenAI(api_key=together_api_key, base_url="https://api.together.xyz/v1")
 
+class UpstreamError(Exception):
+    """외부 API가 에러 응답을 준 경우 (메시지를 담고, 캐시하지 않음)."""
+
+# 워커 간 공유 캐시/속도 제한 백엔드 (프로세스당 하나)
+@st.cache_resource
+def get_shared_backend():
+    """SHARED_BACKEND_URL(secrets 또는 환경변수)로 공유 백엔드를 만듭니다."""
+    try:
+        url = st.secrets["SHARED_BACKEND_URL"]
+    except Exception:
+        url = os.environ.get("SHARED_BACKEND_URL")
+    return backend_from_url(url)
+
+backend = get_shared_backend()
+
+def chat_completion(client, cache=True, **kwargs):
+    """Together AI 호출 (모든 워커가 속도 제한을 공유합니다).
+
+    cache=True면 같은 요청의 결과를 1시간 동안 공유합니다.
+    매번 새 문장이 필요한 생성 요청은 cache=False로 호출하세요.
+    한도를 넘으면 RateLimited가 발생하므로 화면 쪽에서 처리해야 합니다.
+    """
+    def call():
+        response = client.chat.completions.create(**kwargs)
+        return response.choices[0].message.content
+    return backend.cached_call(make_key("together", kwargs), 3600 if cache else 0, "together", call)
+
 # ==========================================
 # 2. [기능] 날씨 API
 # ==========================================
@@ -39,7 +68,7 @@ def get_weather_from_api(city, weather_key):
         "lang": "kr"
     }
     
-    try:
+    def call():
         response = requests.get(base_url, params=params)
         data = response.json()
         
@@ -48,9 +77,16 @@ def get_weather_from_api(city, weather_key):
             desc = data['weather'][0]['description']
             hum = data['main']['humidity']
             return f"{temp}°C, {desc} (습도 {hum}%)"
-        else:
-            return f"에러: {data.get('message', '알 수 없는 오류')}"
-            
+        # 에러 응답은 예외로 넘겨서 캐시하지 않음
+        raise UpstreamError(f"에러: {data.get('message', '알 수 없는 오류')}")
+    
+    try:
+        # 날씨는 10분 동안 워커 간 공유
+        return backend.cached_call(make_key("weather", city), 600, "openweather", call)
+    except UpstreamError as e:
+        return str(e)
+    except RateLimited:
+        return "요청이 많아 잠시 후 다시 시도해주세요."
     except Exception as e:
         return f"통신 에러: {e}"
 
@@ -59,12 +95,16 @@ def get_weather_from_api(city, weather_key):
 # ==========================================
 def get_safety_news(location):
     """실시간 뉴스를 검색해서 안전 정보를 가져옵니다."""
-    try:
+    def call():
         with DDGS() as ddgs:
             keywords = f"{location} travel safety"
             # 뉴스 전용 검색 (최근 1개월 이내만)
-            results = list(ddgs.news(keywords, max_results=5, timelimit="m"))
-            return results if results else []
+            return list(ddgs.news(keywords, max_results=5, timelimit="m"))
+    
+    try:
+        # 뉴스 검색은 30분 동안 워커 간 공유
+        results = backend.cached_call(make_key("news", location), 1800, "duckduckgo", call)
+        return results if results else []
     except:
         return []
 
@@ -80,11 +120,11 @@ def analyze_safety_with_ai(client, location, news_results):
     위험하면 주의사항도 짧게 추가해.
     """
     
-    response = client.chat.completions.create(
+    return chat_completion(
+        client,
         model="Qwen/Qwen2.5-72B-Instruct-Turbo",
         messages=[{"role": "user", "content": prompt}]
     )
-    return response.choices[0].message.content
 
 # ==========================================
 # 4. [기능] 영수증 OCR (OCR.space API)
@@ -152,20 +192,28 @@ def extract_receipt_with_ocr(image_file):
         "apikey": ocr_api_key
     }
     
-    try:
+    def call():
         response = requests.post(url, data=payload, headers=headers)
         result = response.json()
         
         if result.get("IsErroredOnProcessing"):
-            return None, result.get("ErrorMessage", "OCR 처리 실패")
+            raise UpstreamError(result.get("ErrorMessage", "OCR 처리 실패"))
         
         # 텍스트 추출
         parsed_results = result.get("ParsedResults", [])
         if parsed_results:
-            ocr_text = parsed_results[0].get("ParsedText", "")
-            return ocr_text, None
+            return parsed_results[0].get("ParsedText", "")
         
-        return None, "텍스트를 인식하지 못했습니다."
+        raise UpstreamError("텍스트를 인식하지 못했습니다.")
+    
+    try:
+        # 같은 이미지는 하루 동안 다시 OCR하지 않음 (일일 할당량 절약)
+        ocr_text = backend.cached_call(make_key("ocr", base64_image), 86400, "ocr_space", call)
+        return ocr_text, None
+    except UpstreamError as e:
+        return None, str(e)
+    except RateLimited:
+        return None, "요청이 많아 잠시 후 다시 시도해주세요."
     except Exception as e:
         return None, f"API 호출 실패: {e}"
 
@@ -229,7 +277,7 @@ def get_exif_data(image_file):
 
 def get_location_name(lat, lon):
     """GPS 좌표를 장소명으로 변환합니다 (역지오코딩)."""
-    try:
+    def call():
         url = f"https://nominatim.openstreetmap.org/reverse"
         params = {
             "lat": lat,
@@ -242,8 +290,16 @@ def get_location_name(lat, lon):
         
         response = requests.get(url, params=params, headers=headers)
         data = response.json()
+        # 에러 응답({"error": ...})은 캐시하지 않음
+        if response.status_code != 200 or "address" not in data:
+            return None
+        return data
+    
+    try:
+        # 좌표별 결과는 하루 동안 워커 간 공유 (Nominatim 초당 1회 제한)
+        data = backend.cached_call(make_key("nominatim", lat, lon), 86400, "nominatim", call)
         
-        if "address" in data:
+        if data is not None:
             addr = data["address"]
             # 장소명 조합
             parts = []
@@ -271,13 +327,14 @@ def generate_photo_description(client, caption, datetime_str, location_name, use
 
 한 문장으로만 답변해."""
 
-    response = client.chat.completions.create(
+    return chat_completion(
+        client,
+        cache=False,  # 다시 누르면 새 설명 생성
         model="Qwen/Qwen2.5-72B-Instruct-Turbo",
         messages=[{"role": "user", "content": prompt}],
         temperature=0.5,  # 창의성 낮춤
         max_tokens=100
-    )
-    return response.choices[0].message.content.strip()
+    ).strip()
 
 def analyze_receipt_text(client, ocr_text):
     """AI가 OCR 텍스트에서 메뉴, 금액, 날짜, 시간을 추출합니다."""
@@ -299,12 +356,12 @@ def analyze_receipt_text(client, ocr_text):
 날짜: [날짜 또는 "없음"]
 시간: [시간 또는 "없음"]"""
 
-    response = client.chat.completions.create(
+    return chat_completion(
+        client,
         model="Qwen/Qwen2.5-72B-Instruct-Turbo",
         messages=[{"role": "user", "content": prompt}],
         max_tokens=200
     )
-    return response.choices[0].message.content
 
 # ==========================================
 # 4. 화면 UI 구성
@@ -326,13 +383,18 @@ with col2:
             news_results = get_safety_news(location)
             
             # AI 분석
-            ai_analysis = analyze_safety_with_ai(client, location, news_results)
+            try:
+                ai_analysis = analyze_safety_with_ai(client, location, news_results)
+            except RateLimited as e:
+                ai_analysis = None
+                st.warning(f"⏳ {e}")
         
         # 결과 표시
         st.subheader("📋 안전 브리핑")
         
         # AI 분석 결과
-        st.success(f"**🤖 AI 안전 분석**\n\n{ai_analysis}")
+        if ai_analysis is not None:
+            st.success(f"**🤖 AI 안전 분석**\n\n{ai_analysis}")
         
         # 뉴스 링크
         if news_results:
@@ -413,6 +475,8 @@ with tab1:
                                 st.session_state.ocr_time = "" if time_val == "없음" else time_val
                         
                         st.rerun()
+                except RateLimited as e:
+                    st.warning(f"⏳ {e}")
                 except Exception as e:
                     st.error(f"인식 실패: {e}")
     
@@ -514,15 +578,19 @@ with tab2:
     # AI 설명 생성
     if photo_file and st.button("✨ AI 설명 생성", key="generate_caption"):
         with st.spinner("AI가 설명 작성 중..."):
-            ai_caption = generate_photo_description(
-                client, 
-                photo_memo, 
-                photo_datetime, 
-                photo_location_input, 
-                location
-            )
-            st.session_state.photo_ai_caption = ai_caption
-            st.success(f"**AI 설명:** {ai_caption}")
+            try:
+                ai_caption = generate_photo_description(
+                    client, 
+                    photo_memo, 
+                    photo_datetime, 
+                    photo_location_input, 
+                    location
+                )
+            except RateLimited as e:
+                st.warning(f"⏳ {e}")
+            else:
+                st.session_state.photo_ai_caption = ai_caption
+                st.success(f"**AI 설명:** {ai_caption}")
     
     # 최종 설명
     final_caption = st.text_area(
@@ -611,42 +679,49 @@ with tab3:
                 - 과장 없이 사실 위주로
                 """
                 
-                response = client.chat.completions.create(
-                    model="Qwen/Qwen2.5-72B-Instruct-Turbo",
-                    messages=[{"role": "user", "content": final_prompt}],
-                    temperature=0.5,  # 창의성 낮춤 (기본값 1.0)
-                    max_tokens=300    # 길이 제한
-                )
-                
-                # 결과 표시
-                st.markdown("---")
-                st.subheader("✨ 나의 여행 이야기")
-                
-                # 사진과 함께 여행기 표시
-                for p in st.session_state.photos:
-                    col_photo, col_desc = st.columns([1, 2])
-                    with col_photo:
-                        st.image(p["image"], use_container_width=True)
-                    with col_desc:
-                        st.write(f"**{p['caption']}**")
-                        if p.get('datetime'):
-                            st.caption(f"📅 {p['datetime']}")
-                        if p.get('location'):
-                            st.caption(f"📍 {p['location']}")
-                    st.markdown("")
-                
-                st.markdown("---")
-                st.markdown(response.choices[0].message.content)
+                try:
+                    diary = chat_completion(
+                        client,
+                        cache=False,  # 다시 누르면 새 여행기 생성
+                        model="Qwen/Qwen2.5-72B-Instruct-Turbo",
+                        messages=[{"role": "user", "content": final_prompt}],
+                        temperature=0.5,  # 창의성 낮춤 (기본값 1.0)
+                        max_tokens=300    # 길이 제한
+                    )
+                except RateLimited as e:
+                    diary = None
+                    st.warning(f"⏳ {e}")
                 
-                # 지출 요약
-                if st.session_state.receipts:
+                if diary is not None:
+                    # 결과 표시
                     st.markdown("---")
-                    st.subheader("💰 지출 요약")
-                    for r in st.session_state.receipts:
-                        date_info = ""
-                        if r.get('date') or r.get('time'):
-                            date_info = f" ({r.get('date', '')} {r.get('time', '')})"
-                        st.write(f"• {r['text']}: **{r['amount']}**{date_info}")
+                    st.subheader("✨ 나의 여행 이야기")
+                    
+                    # 사진과 함께 여행기 표시
+                    for p in st.session_state.photos:
+                        col_photo, col_desc = st.columns([1, 2])
+                        with col_photo:
+                            st.image(p["image"], use_container_width=True)
+                        with col_desc:
+                            st.write(f"**{p['caption']}**")
+                            if p.get('datetime'):
+                                st.caption(f"📅 {p['datetime']}")
+                            if p.get('location'):
+                                st.caption(f"📍 {p['location']}")
+                        st.markdown("")
+                    
+                    st.markdown("---")
+                    st.markdown(diary)
+                    
+                    # 지출 요약
+                    if st.session_state.receipts:
+                        st.markdown("---")
+                        st.subheader("💰 지출 요약")
+                        for r in st.session_state.receipts:
+                            date_info = ""
+                            if r.get('date') or r.get('time'):
+                                date_info = f" ({r.get('date', '')} {r.get('time', '')})"
+                            st.write(f"• {r['text']}: **{r['amount']}**{date_info}")
     
     # 초기화 버튼
     if st.session_state.photos or st.session_state.receipts:
@@ -0,0 +1,266 @@
+"""여러 Streamlit 워커가 함께 쓰는 캐시/속도 제한 백엔드.
+
+로드밸런서 뒤에서 프로세스 여러 개가 떠 있어도 외부 API 입장에서는
+하나의 클라이언트처럼 보이도록, 결과 캐시와 토큰 버킷을 프로세스 밖에 둡니다.
+
+- SQLiteBackend: 같은 호스트의 워커끼리 공유 (파일 또는 /dev/shm 경로)
+- RedisBackend: 여러 호스트에서 공유 (Redis 프로토콜 서버)
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+
+try:
+    from redis.exceptions import WatchError
+except ImportError:
+    WatchError = None
+
+logger = logging.getLogger(__name__)
+
+# ==========================================
+# 업스트림별 토큰 버킷 설정: (초당 충전량, 최대 버스트)
+# ==========================================
+RATE_LIMITS = {
+    "nominatim": (1.0, 1),             # Nominatim 정책: 초당 1회
+    "openweather": (1.0, 10),          # 무료 플랜: 분당 60회
+    "ocr_space": (500 / 86400, 10),    # 무료 플랜: 하루 500회
+    "duckduckgo": (1.0, 2),
+    "together": (5.0, 10),
+}
+
+
+class RateLimited(Exception):
+    """max_wait 안에 토큰을 얻지 못했을 때 발생합니다."""
+
+
+def make_key(namespace, *parts):
+    """호출 인자로 캐시 키를 만듭니다."""
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return f"{namespace}:{hashlib.sha256(raw.encode('utf-8')).hexdigest()}"
+
+
+class SharedBackend:
+    """공유 캐시 + 토큰 버킷 인터페이스."""
+
+    def get(self, key):
+        """캐시 값을 반환합니다. 없거나 만료되면 None."""
+        raise NotImplementedError
+
+    def set(self, key, value, ttl):
+        """값을 ttl(초) 동안 캐시합니다. 값은 JSON 직렬화 가능해야 합니다."""
+        raise NotImplementedError
+
+    def acquire(self, upstream, rate, capacity):
+        """토큰 하나를 가져옵니다. 성공하면 0, 아니면 기다려야 할 초를 반환합니다."""
+        raise NotImplementedError
+
+    def throttle(self, upstream, max_wait=10):
+        """토큰을 얻을 때까지 기다립니다 (모든 워커 합산 기준).
+
+        총 대기 시간이 max_wait(초)를 넘게 되면 기다리지 않고 RateLimited를 발생시킵니다.
+        """
+        rate, capacity = RATE_LIMITS.get(upstream, (1.0, 1))
+        deadline = time.time() + max_wait
+        while True:
+            wait = self.acquire(upstream, rate, capacity)
+            if wait <= 0:
+                return
+            if time.time() + wait > deadline:
+                raise RateLimited(f"{upstream} 요청이 많습니다. {wait:.0f}초 후 다시 시도해주세요.")
+            time.sleep(wait)
+
+    def cached_call(self, key, ttl, upstream, fn, max_wait=10):
+        """캐시에 있으면 바로 반환하고, 없으면 속도 제한 후 fn()을 호출합니다.
+
+        - fn()이 None을 반환하면 (실패) 캐시하지 않습니다.
+        - ttl이 0이면 캐시 없이 속도 제한만 적용합니다.
+        - 백엔드 자체가 실패하면 (Redis 다운, SQLite 잠김 등) 로그만 남기고 fn()을 바로 호출합니다.
+        """
+        if ttl > 0:
+            try:
+                value = self.get(key)
+            except Exception:
+                logger.exception("공유 캐시 조회 실패: %s", key)
+                value = None
+            if value is not None:
+                return value
+        try:
+            self.throttle(upstream, max_wait)
+        except RateLimited:
+            raise
+        except Exception:
+            logger.exception("공유 속도 제한 실패: %s", upstream)
+        value = fn()
+        if value is not None and ttl > 0:
+            try:
+                self.set(key, value, ttl)
+            except Exception:
+                logger.exception("공유 캐시 저장 실패: %s", key)
+        return value
+
+
+def _refill(tokens, updated_at, now, rate, capacity):
+    """토큰 버킷 한 번 갱신: (남은 토큰, 대기 시간)을 반환합니다."""
+    if tokens is None:
+        tokens = float(capacity)
+    else:
+        tokens = min(float(capacity), tokens + max(0.0, now - updated_at) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+
+# ==========================================
+# SQLite 구현 (단일 호스트)
+# ==========================================
+class SQLiteBackend(SharedBackend):
+    """SQLite 파일을 통해 같은 호스트의 프로세스끼리 상태를 공유합니다."""
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(tempfile.gettempdir(), "trippy_shared.db")
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            # set()의 만료 항목 정리가 전체 테이블을 훑지 않도록
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_expires ON cache(expires_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets "
+                "(name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        # Streamlit은 세션마다 스레드가 다르므로 호출마다 연결을 엽니다.
+        return _Connection(self.path)
+
+    def get(self, key):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time() + ttl),
+            )
+
+    def acquire(self, upstream, rate, capacity):
+        with self._connect() as conn:
+            # 쓰기 잠금을 먼저 잡아서 읽기-수정-쓰기를 원자적으로 처리
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT tokens, updated_at FROM buckets WHERE name = ?", (upstream,)
+            ).fetchone()
+            now = time.time()
+            tokens, wait = _refill(row[0] if row else None, row[1] if row else now,
+                                   now, rate, capacity)
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (name, tokens, updated_at) VALUES (?, ?, ?)",
+                (upstream, tokens, now),
+            )
+        return wait
+
+
+class _Connection:
+    """autocommit 연결을 열고, with 블록이 끝나면 커밋/롤백 후 닫습니다."""
+
+    # 잠금 대기는 throttle의 max_wait보다 훨씬 짧게: 넘으면 백엔드 장애로 보고
+    # cached_call이 캐시 없이 바로 호출합니다.
+    BUSY_TIMEOUT = 2
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, timeout=self.BUSY_TIMEOUT, isolation_level=None)
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if self.conn.in_transaction:
+                self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.conn.close()
+
+
+# ==========================================
+# Redis 구현 (여러 호스트)
+# ==========================================
+class RedisBackend(SharedBackend):
+    """Redis 프로토콜 서버를 통해 상태를 공유합니다.
+
+    client를 직접 넘기면 (예: fakeredis) 그대로 사용하고,
+    아니면 url로 redis 패키지의 클라이언트를 만듭니다.
+    직접 넘기는 client는 redis-py와 같은 pipeline() / watch() / multi() / execute()
+    API를 지원해야 하며, redis-py가 없다면 충돌 시 발생하는 예외를 watch_error로 넘겨야 합니다.
+    """
+
+    def __init__(self, url="redis://localhost:6379/0", client=None, prefix="trippy:",
+                 watch_error=None):
+        self.watch_error = watch_error or WatchError
+        if self.watch_error is None:
+            raise RuntimeError("RedisBackend를 쓰려면 `pip install redis`가 필요합니다.")
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self.redis = client
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.redis.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl):
+        self.redis.set(self.prefix + key, json.dumps(value, ensure_ascii=False),
+                       ex=max(1, int(ttl)))
+
+    def acquire(self, upstream, rate, capacity):
+        key = f"{self.prefix}bucket:{upstream}"
+        with self.redis.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    tokens, updated_at = pipe.hmget(key, "tokens", "updated_at")
+                    # 호스트 간 시계 차이를 피하려고 서버 시간을 사용
+                    sec, usec = pipe.time()
+                    now = sec + usec / 1_000_000
+                    tokens, wait = _refill(
+                        float(tokens) if tokens is not None else None,
+                        float(updated_at) if updated_at is not None else now,
+                        now, rate, capacity,
+                    )
+                    pipe.multi()
+                    pipe.hset(key, mapping={"tokens": tokens, "updated_at": now})
+                    # 버킷이 가득 차는 시간이 지나면 키를 정리
+                    pipe.expire(key, int(capacity / rate) + 60)
+                    pipe.execute()
+                    return wait
+                except self.watch_error:
+                    continue
+
+
+def backend_from_url(url=None):
+    """URL로 백엔드를 고릅니다.
+
+    - redis://, rediss://, unix:// → RedisBackend
+    - sqlite:///경로 → SQLiteBackend
+    - 비어 있으면 임시 디렉터리의 SQLite 파일
+    """
+    if not url:
+        return SQLiteBackend()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(url)
+    if url.startswith("sqlite:///"):
+        return SQLiteBackend(url[len("sqlite:///"):] or None)
+    raise ValueError(f"지원하지 않는 SHARED_BACKEND_URL: {url}")
@@ -0,0 +1,193 @@
+import multiprocessing
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from shared_backend import (
+    RateLimited,
+    RedisBackend,
+    SharedBackend,
+    SQLiteBackend,
+    _refill,
+    make_key,
+)
+
+
+def _sqlite_backend(tmp_path):
+    return SQLiteBackend(str(tmp_path / "shared.db"))
+
+
+def _redis_backend(tmp_path):
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisBackend(client=fakeredis.FakeRedis())
+
+
+@pytest.fixture(params=[_sqlite_backend, _redis_backend], ids=["sqlite", "redis"])
+def backend(request, tmp_path):
+    return request.param(tmp_path)
+
+
+# ==========================================
+# 토큰 버킷 계산
+# ==========================================
+def test_refill_new_bucket_starts_full():
+    assert _refill(None, 0, 0, rate=1.0, capacity=3) == (2.0, 0.0)
+
+
+def test_refill_empty_bucket_returns_wait():
+    tokens, wait = _refill(0.0, 100.0, 100.0, rate=2.0, capacity=1)
+    assert tokens == 0.0
+    assert wait == pytest.approx(0.5)
+
+
+def test_refill_adds_tokens_up_to_capacity():
+    assert _refill(0.0, 100.0, 101.5, rate=1.0, capacity=10) == (0.5, 0.0)
+    assert _refill(0.0, 100.0, 1000.0, rate=1.0, capacity=2) == (1.0, 0.0)
+
+
+def test_refill_ignores_clock_going_backwards():
+    tokens, wait = _refill(0.5, 100.0, 99.0, rate=1.0, capacity=1)
+    assert tokens == 0.5
+    assert wait == pytest.approx(0.5)
+
+
+# ==========================================
+# 캐시
+# ==========================================
+def test_get_set_roundtrip(backend):
+    key = make_key("test", "파리", 1)
+    assert backend.get(key) is None
+    backend.set(key, {"name": "에펠탑", "items": [1, 2]}, 60)
+    assert backend.get(key) == {"name": "에펠탑", "items": [1, 2]}
+
+
+def test_set_expires(backend):
+    backend.set("short", "value", 1)
+    assert backend.get("short") == "value"
+    time.sleep(1.2)
+    assert backend.get("short") is None
+
+
+def test_cached_call_reuses_result_and_skips_failures(backend):
+    calls = []
+
+    def ok():
+        calls.append(1)
+        return "결과"
+
+    assert backend.cached_call("k", 60, "together", ok) == "결과"
+    assert backend.cached_call("k", 60, "together", ok) == "결과"
+    assert len(calls) == 1
+
+    assert backend.cached_call("fail", 60, "together", lambda: None) is None
+    assert backend.get("fail") is None
+
+
+def test_cached_call_ttl_zero_does_not_cache(backend):
+    calls = []
+    for _ in range(2):
+        backend.cached_call("nocache", 0, "together", lambda: calls.append(1) or "x")
+    assert len(calls) == 2
+    assert backend.get("nocache") is None
+
+
+# ==========================================
+# 속도 제한
+# ==========================================
+def test_throttle_raises_instead_of_blocking(backend):
+    # ocr_space: 버스트 10회 이후 다음 토큰까지 약 173초
+    for _ in range(10):
+        backend.throttle("ocr_space")
+    start = time.time()
+    with pytest.raises(RateLimited):
+        backend.throttle("ocr_space", max_wait=1)
+    assert time.time() - start < 0.5
+
+
+def test_throttle_threads_share_one_per_second(backend):
+    times = []
+    lock = threading.Lock()
+
+    def worker():
+        backend.throttle("nominatim")
+        with lock:
+            times.append(time.time())
+
+    threads = [threading.Thread(target=worker) for _ in range(3)]
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    times.sort()
+    assert times[-1] - start >= 1.9
+    assert all(b - a >= 0.9 for a, b in zip(times, times[1:]))
+
+
+def _sqlite_worker(path, queue):
+    SQLiteBackend(path).throttle("nominatim")
+    queue.put(time.time())
+
+
+def test_sqlite_throttle_processes_share_one_per_second(tmp_path):
+    path = str(tmp_path / "shared.db")
+    SQLiteBackend(path)
+    ctx = multiprocessing.get_context()
+    queue = ctx.Queue()
+    procs = [ctx.Process(target=_sqlite_worker, args=(path, queue)) for _ in range(4)]
+    for p in procs:
+        p.start()
+    times = sorted(queue.get(timeout=30) for _ in procs)
+    for p in procs:
+        p.join()
+
+    assert all(b - a >= 0.9 for a, b in zip(times, times[1:]))
+
+
+# ==========================================
+# 백엔드 장애 시 기존 동작으로 복귀
+# ==========================================
+class _BrokenBackend(SharedBackend):
+    def get(self, key):
+        raise ConnectionError("redis down")
+
+    def set(self, key, value, ttl):
+        raise ConnectionError("redis down")
+
+    def acquire(self, upstream, rate, capacity):
+        raise ConnectionError("redis down")
+
+
+def test_cached_call_falls_through_when_backend_fails():
+    assert _BrokenBackend().cached_call("k", 60, "together", lambda: "결과") == "결과"
+
+
+def test_cached_call_falls_through_when_sqlite_is_locked(tmp_path):
+    path = str(tmp_path / "shared.db")
+    backend = SQLiteBackend(path)
+    holder = sqlite3.connect(path, isolation_level=None)
+    holder.execute("BEGIN IMMEDIATE")
+    try:
+        start = time.time()
+        assert backend.cached_call("k", 60, "together", lambda: "결과") == "결과"
+        assert time.time() - start < 10
+    finally:
+        holder.execute("ROLLBACK")
+        holder.close()
+
+
+# ==========================================
+# 한도 초과는 결과가 아니라 예외로 전달
+# ==========================================
+def test_rate_limited_reaches_caller_without_calling_fn(backend):
+    calls = []
+    for _ in range(10):
+        backend.throttle("ocr_space")
+
+    with pytest.raises(RateLimited):
+        backend.cached_call("ocr", 60, "ocr_space", lambda: calls.append(1) or "텍스트", max_wait=1)
+    assert calls == []
+    assert backend.get("ocr") is None